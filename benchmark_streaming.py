@@ -0,0 +1,186 @@
+"""Compare the sequential pipeline against the streaming pipeline on a simulated token stream.
+
+No network access is needed: the OpenAI client and Supabase connector are replaced
+with fakes that emit deterministic responses at a fixed per-token latency.
+
+    python benchmark_streaming.py --token-delay 0.002
+"""
+import argparse
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+from typing import List, Dict, Any
+
+import workers
+from workers import (
+    FoodSafetyPipeline,
+    SupabaseConnector,
+    FoodSafetyAlert,
+    PatternAnalysis,
+    RiskAssessment,
+    AlertsResponse,
+)
+
+ESTABLISHMENT_IDS = list(range(1, 21))
+CHARS_PER_TOKEN = 4
+
+def fake_pattern_analysis() -> Dict[str, Any]:
+    return {
+        "symptom_clusters": [{"symptoms": ["nausea", "vomiting"], "frequency": 12, "severity": "moderate", "description": "GI illness cluster"}],
+        "geographic_patterns": [{"region": "Downtown", "case_count": 9, "concentration": 0.6, "description": "Concentrated downtown"}],
+        "temporal_patterns": [{"timeframe": "last 3 days", "trend": "increasing", "case_rate": 3.5, "description": "Rising case rate"}],
+        "food_items": [{"name": "Chicken Burrito", "frequency": 7, "associated_cases": 7, "risk_level": "high"}],
+        "summary": "Rising GI illness concentrated downtown, linked to poultry dishes."
+    }
+
+def fake_risk_assessment(num_areas: int) -> Dict[str, Any]:
+    return {
+        "overall_risk_level": "high",
+        "risk_areas": [
+            {
+                "type": f"Outbreak cluster {i}",
+                "severity": ["medium", "high", "critical"][i % 3],
+                "justification": "Multiple reports of similar symptoms after eating at the same establishments within a short window. " * 3,
+                "affected_establishments": ESTABLISHMENT_IDS[i * 2:i * 2 + 2]
+            }
+            for i in range(num_areas)
+        ]
+    }
+
+def fake_alerts(risk_areas: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {
+        "alerts": [
+            {
+                "establishment_id": establishment_id,
+                "alert_type": "outbreak",
+                "severity": area["severity"],
+                "case_count": 5,
+                "details": f"{area['type']}: inspect food handling and holding temperatures immediately. " * 2
+            }
+            for area in risk_areas
+            for establishment_id in area["affected_establishments"]
+        ]
+    }
+
+class FakeCompletions:
+    """Stands in for `client.beta.chat.completions` with per-token latency"""
+    def __init__(self, token_delay: float, num_areas: int):
+        self.token_delay = token_delay
+        self.num_areas = num_areas
+
+    def _respond(self, messages: List[Dict[str, str]], response_format: type) -> str:
+        if response_format is PatternAnalysis:
+            return json.dumps(fake_pattern_analysis())
+        if response_format is RiskAssessment:
+            return json.dumps(fake_risk_assessment(self.num_areas))
+        if response_format is AlertsResponse:
+            return json.dumps(fake_alerts(json.loads(messages[-1]["content"])["risk_areas"]))
+        raise ValueError(f"Unexpected response format: {response_format}")
+
+    def _usage(self, content: str) -> SimpleNamespace:
+        return SimpleNamespace(total_tokens=len(content) // CHARS_PER_TOKEN)
+
+    def parse(self, *, messages, response_format, **kwargs):
+        content = self._respond(messages, response_format)
+        time.sleep(self.token_delay * len(content) / CHARS_PER_TOKEN)
+        message = SimpleNamespace(parsed=response_format.model_validate_json(content))
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=self._usage(content))
+
+    def stream(self, *, messages, response_format, **kwargs):
+        return FakeStreamManager(self, self._respond(messages, response_format))
+
+class FakeStreamManager:
+    def __init__(self, completions: FakeCompletions, content: str):
+        self.completions = completions
+        self.content = content
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def __iter__(self):
+        for i in range(0, len(self.content), CHARS_PER_TOKEN):
+            time.sleep(self.completions.token_delay)
+            yield SimpleNamespace(type="content.delta", delta=self.content[i:i + CHARS_PER_TOKEN])
+
+    def get_final_completion(self):
+        return SimpleNamespace(
+            choices=[SimpleNamespace(finish_reason="stop")],
+            usage=self.completions._usage(self.content)
+        )
+
+class FakeOpenAI:
+    def __init__(self, token_delay: float, num_areas: int):
+        self.beta = SimpleNamespace(chat=SimpleNamespace(completions=FakeCompletions(token_delay, num_areas)))
+        self.models = SimpleNamespace(retrieve=lambda model: None)
+
+class FakeSupabaseConnector(SupabaseConnector):
+    """Records when each batch of alerts is written instead of calling Supabase"""
+    def __init__(self, url: str, key: str):
+        self.valid_establishment_ids = set(ESTABLISHMENT_IDS)
+        self.insert_times: List[float] = []
+        self.batch_sizes: List[int] = []
+
+    async def insert_alerts(self, alerts: List[FoodSafetyAlert]) -> None:
+        valid_alerts = self.validate_establishment_ids(alerts)
+        self.insert_times.append(time.perf_counter())
+        self.batch_sizes.append(len(valid_alerts))
+
+def build_pipeline(token_delay: float, num_areas: int) -> FoodSafetyPipeline:
+    workers.SupabaseConnector = FakeSupabaseConnector
+    try:
+        return FoodSafetyPipeline("http://localhost", "benchmark", FakeOpenAI(token_delay, num_areas))
+    finally:
+        workers.SupabaseConnector = SupabaseConnector
+
+async def run_sequential(pipeline: FoodSafetyPipeline, cases_data: List[Dict]) -> List[FoodSafetyAlert]:
+    patterns = await pipeline.analyze_patterns(cases_data)
+    risks = await pipeline.assess_risk(patterns)
+    alerts = await pipeline.generate_alerts(risks)
+    await pipeline.supabase.insert_alerts(alerts)
+    return alerts
+
+async def measure(mode: str, token_delay: float, num_areas: int, batch_size: int) -> Dict[str, Any]:
+    pipeline = build_pipeline(token_delay, num_areas)
+    cases_data = [{"id": i, "establishment_id": i % len(ESTABLISHMENT_IDS) + 1} for i in range(50)]
+
+    start = time.perf_counter()
+    if mode == "sequential":
+        alerts = await run_sequential(pipeline, cases_data)
+    else:
+        alerts = await pipeline.run_streaming(cases_data, batch_size=batch_size)
+    total = time.perf_counter() - start
+
+    return {
+        "mode": mode,
+        "alerts": len(alerts),
+        "inserts": len(pipeline.supabase.batch_sizes),
+        "time_to_first_alert": pipeline.supabase.insert_times[0] - start,
+        "total_time": total,
+    }
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--token-delay", type=float, default=0.002, help="Seconds per simulated token")
+    parser.add_argument("--risk-areas", type=int, default=6, help="Risk areas in the simulated assessment")
+    parser.add_argument("--batch-size", type=int, default=5, help="Alerts per insert in streaming mode")
+    args = parser.parse_args()
+
+    results = [
+        await measure(mode, args.token_delay, args.risk_areas, args.batch_size)
+        for mode in ("sequential", "streaming")
+    ]
+
+    print(f"{'mode':<12}{'alerts':>8}{'inserts':>9}{'first alert (s)':>17}{'total (s)':>11}")
+    for r in results:
+        print(f"{r['mode']:<12}{r['alerts']:>8}{r['inserts']:>9}{r['time_to_first_alert']:>17.3f}{r['total_time']:>11.3f}")
+
+    sequential, streaming = results
+    print(f"\nTime to first alert: {sequential['time_to_first_alert'] / streaming['time_to_first_alert']:.1f}x faster")
+    print(f"End-to-end: {sequential['total_time'] / streaming['total_time']:.1f}x faster")
+
+if __name__ == "__main__":
+    asyncio.run(main())
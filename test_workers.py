@@ -0,0 +1,270 @@
+import asyncio
+import json
+import random
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from benchmark_streaming import build_pipeline, fake_pattern_analysis
+from workers import StreamingArrayParser, RiskArea, RiskAssessment, FoodSafetyAlert, AIWorker, ModelConfig, PatternAnalysis
+
+RISK_AREAS = [
+    {
+        "type": 'Quoted "outbreak" with \\ backslash',
+        "severity": "high",
+        "justification": "Brackets ] } [ { and a fake key \"risk_areas\": [ inside a string",
+        "affected_establishments": [1, 2]
+    },
+    {"type": "Temperature abuse", "severity": "low", "justification": "Unicode café ✓", "affected_establishments": []},
+    {"type": "Cross contamination", "severity": "critical", "justification": "x", "affected_establishments": [3]},
+]
+
+RESPONSE = {
+    "overall_risk_level": "high",
+    "context": {"risk_areas": [{"type": "nested, not the target"}]},
+    "risk_areas": RISK_AREAS,
+    "notes": ["trailing", {"field": True}],
+}
+
+def feed_in_random_chunks(text: str, seed: int) -> tuple[StreamingArrayParser, list[RiskArea]]:
+    rng = random.Random(seed)
+    parser = StreamingArrayParser("risk_areas", RiskArea)
+    items = []
+    pos = 0
+    while pos < len(text):
+        size = rng.randint(1, 12)
+        items.extend(parser.feed(text[pos:pos + size]))
+        pos += size
+    return parser, items
+
+@pytest.mark.parametrize("seed", range(50))
+@pytest.mark.parametrize("indent", [None, 2])
+def test_parser_yields_items_across_random_chunks(seed, indent):
+    parser, items = feed_in_random_chunks(json.dumps(RESPONSE, indent=indent, ensure_ascii=False), seed)
+
+    assert [item.model_dump() for item in items] == RISK_AREAS
+    assert parser.fields == {k: v for k, v in RESPONSE.items() if k != "risk_areas"}
+    assert parser.is_complete()
+
+def test_parser_emits_item_as_soon_as_it_closes():
+    text = json.dumps(RESPONSE)
+    first_item_end = text.index(json.dumps(RISK_AREAS[0])) + len(json.dumps(RISK_AREAS[0]))
+    parser = StreamingArrayParser("risk_areas", RiskArea)
+
+    assert parser.feed(text[:first_item_end - 1]) == []
+    assert parser.fields == {"overall_risk_level": "high", "context": RESPONSE["context"]}
+    assert [item.model_dump() for item in parser.feed(text[first_item_end - 1:first_item_end])] == RISK_AREAS[:1]
+
+@pytest.mark.parametrize("cut", [10, 200, -30, -1])
+def test_parser_reports_truncated_stream(cut):
+    parser = StreamingArrayParser("risk_areas", RiskArea)
+    parser.feed(json.dumps(RESPONSE)[:cut])
+
+    assert not parser.is_complete()
+
+
+def make_alert(establishment_id: int, severity: str = "medium") -> FoodSafetyAlert:
+    return FoodSafetyAlert(establishment_id=establishment_id, alert_type="outbreak", severity=severity, case_count=1, details="d")
+
+def scripted_pipeline(area_scripts, events=None):
+    """Pipeline whose risk area i streams area_scripts[i], a list of (delay, alert or exception)"""
+    events = events if events is not None else {}
+    events.setdefault("cancelled", [])
+    events.setdefault("active", 0)
+    events.setdefault("max_active", 0)
+    pipeline = build_pipeline(0, len(area_scripts))
+
+    async def stream_risk_areas(patterns):
+        for i in range(len(area_scripts)):
+            area = RiskArea(type=str(i), severity="low", justification="j", affected_establishments=[])
+            yield RiskAssessment(overall_risk_level="high", risk_areas=[area])
+
+    async def stream_alerts(risk_assessment):
+        index = int(risk_assessment.risk_areas[0].type)
+        events["active"] += 1
+        events["max_active"] = max(events["max_active"], events["active"])
+        try:
+            for delay, item in area_scripts[index]:
+                await asyncio.sleep(delay)
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        except asyncio.CancelledError:
+            events["cancelled"].append(index)
+            raise
+        finally:
+            events["active"] -= 1
+
+    pipeline.stream_risk_areas = stream_risk_areas
+    pipeline.stream_alerts = stream_alerts
+    return pipeline
+
+def test_run_streaming_writes_full_batches():
+    pipeline = scripted_pipeline([[(0, make_alert(i)) for i in range(1, 13)]])
+
+    alerts = asyncio.run(pipeline.run_streaming([], batch_size=5))
+
+    assert len(alerts) == 12
+    assert pipeline.supabase.batch_sizes == [5, 5, 2]
+
+def test_run_streaming_flushes_partial_batch_after_flush_interval():
+    # Alerts keep arriving faster than flush_interval, so only a deadline set by the first one flushes it
+    pipeline = scripted_pipeline([[(0.05, make_alert(i)) for i in range(1, 9)]])
+
+    start = time.perf_counter()
+    asyncio.run(pipeline.run_streaming([], batch_size=100, flush_interval=0.15))
+
+    assert pipeline.supabase.insert_times[0] - start < 0.3
+    assert len(pipeline.supabase.batch_sizes) >= 2
+    assert sum(pipeline.supabase.batch_sizes) == 8
+
+def test_run_streaming_drops_duplicates_but_keeps_escalations():
+    pipeline = scripted_pipeline([
+        [(0, make_alert(1, "medium")), (0, make_alert(2, "high"))],
+        [(0.01, make_alert(1, "medium")), (0.01, make_alert(1, "critical")), (0.01, make_alert(2, "low"))],
+    ])
+
+    alerts = asyncio.run(pipeline.run_streaming([]))
+
+    assert [(a.establishment_id, a.severity) for a in alerts] == [(1, "medium"), (2, "high"), (1, "critical")]
+
+def test_run_streaming_cancels_areas_when_one_fails():
+    events = {}
+    pipeline = scripted_pipeline([
+        [(0, make_alert(1)), (0.01, RuntimeError("boom"))],
+        [(0, make_alert(2)), (10, make_alert(3))],
+    ], events)
+
+    with pytest.raises(RuntimeError, match="boom"):
+        asyncio.run(pipeline.run_streaming([]))
+
+    assert events["cancelled"] == [1]
+    assert sum(pipeline.supabase.batch_sizes) == 2
+
+def test_run_streaming_stops_streaming_when_insert_fails():
+    events = {}
+    pipeline = scripted_pipeline([[(0, make_alert(1)), (10, make_alert(2))]], events)
+
+    async def failing_insert(alerts):
+        raise RuntimeError("insert failed")
+    pipeline.supabase.insert_alerts = failing_insert
+
+    start = time.perf_counter()
+    with pytest.raises(RuntimeError, match="insert failed"):
+        asyncio.run(pipeline.run_streaming([], batch_size=1))
+
+    assert time.perf_counter() - start < 1
+    assert events["cancelled"] == [0]
+
+def test_run_streaming_limits_concurrent_alert_streams():
+    events = {}
+    pipeline = scripted_pipeline([[(0.02, make_alert(i))] for i in range(1, 11)], events)
+
+    alerts = asyncio.run(pipeline.run_streaming([], max_concurrent_streams=3))
+
+    assert len(alerts) == 10
+    assert events["max_active"] == 3
+
+class FakeChunkStream(list):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+class FakeStructuredStream:
+    def __init__(self, events):
+        self.events = events
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def __iter__(self):
+        return self.events
+
+def json_mode_client(text: str, finish_reason: str = "stop", structured_deltas=()):
+    """Client whose structured stream fails after `structured_deltas`, and whose JSON mode streams `text`"""
+    calls = []
+
+    def structured_events():
+        for delta in structured_deltas:
+            yield SimpleNamespace(type="content.delta", delta=delta)
+        raise RuntimeError("structured outputs unavailable")
+
+    def stream(**kwargs):
+        return FakeStructuredStream(structured_events())
+
+    def create(**kwargs):
+        calls.append(kwargs)
+        chunks = [
+            SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text[i:i + 3]), finish_reason=None)], usage=None)
+            for i in range(0, len(text), 3)
+        ]
+        chunks.append(SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=None), finish_reason=finish_reason)], usage=None))
+        chunks.append(SimpleNamespace(choices=[], usage=SimpleNamespace(total_tokens=42)))
+        return FakeChunkStream(chunks)
+
+    client = SimpleNamespace(
+        beta=SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(stream=stream))),
+        chat=SimpleNamespace(completions=SimpleNamespace(create=create))
+    )
+    return client, calls
+
+async def collect(async_iterator):
+    return [item async for item in async_iterator]
+
+def risk_area_stream(client):
+    worker = AIWorker(ModelConfig("model", 0, 100, 0.01), client)
+    return worker, worker.stream_with_schema({}, "prompt", RiskAssessment, "risk_areas")
+
+def test_stream_with_schema_falls_back_to_json_mode_before_first_delta():
+    client, calls = json_mode_client(json.dumps({"risk_areas": RISK_AREAS, "overall_risk_level": "low"}))
+    worker, stream = risk_area_stream(client)
+
+    items = asyncio.run(collect(stream))
+
+    assert [item.model_dump() for item in items] == RISK_AREAS
+    assert len(calls) == 1
+    assert worker.total_tokens == 42
+
+def test_stream_with_schema_does_not_fall_back_after_first_delta():
+    client, calls = json_mode_client(json.dumps({"risk_areas": RISK_AREAS}), structured_deltas=['{"risk_'])
+    worker, stream = risk_area_stream(client)
+
+    with pytest.raises(RuntimeError, match="structured outputs unavailable"):
+        asyncio.run(collect(stream))
+    assert calls == []
+
+def test_stream_with_schema_raises_on_length_finish_reason():
+    client, _ = json_mode_client(json.dumps({"risk_areas": RISK_AREAS})[:200], finish_reason="length")
+    worker, stream = risk_area_stream(client)
+
+    with pytest.raises(ValueError, match="truncated"):
+        asyncio.run(collect(stream))
+
+def test_stream_with_schema_raises_on_incomplete_array():
+    client, _ = json_mode_client(json.dumps({"risk_areas": RISK_AREAS})[:200])
+    worker, stream = risk_area_stream(client)
+
+    with pytest.raises(ValueError, match="before the 'risk_areas' array was complete"):
+        asyncio.run(collect(stream))
+
+def test_stream_risk_areas_holds_areas_until_overall_risk_level_is_known():
+    pipeline = build_pipeline(0, 0)
+    pipeline.risk_assessor.client, _ = json_mode_client(json.dumps({"risk_areas": RISK_AREAS, "overall_risk_level": "critical"}))
+
+    assessments = asyncio.run(collect(pipeline.stream_risk_areas(PatternAnalysis(**fake_pattern_analysis()))))
+
+    assert [a.risk_areas[0].model_dump() for a in assessments] == RISK_AREAS
+    assert {a.overall_risk_level for a in assessments} == {"critical"}
+
+def test_stream_risk_areas_requires_overall_risk_level():
+    pipeline = build_pipeline(0, 0)
+    pipeline.risk_assessor.client, _ = json_mode_client(json.dumps({"risk_areas": RISK_AREAS}))
+
+    with pytest.raises(ValueError, match="without overall_risk_level"):
+        asyncio.run(collect(pipeline.stream_risk_areas(PatternAnalysis(**fake_pattern_analysis()))))
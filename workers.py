@@ -1,4 +1,4 @@
-from typing import List, Dict, Any, Literal
+from typing import List, Dict, Any, Literal, Iterator, AsyncIterator, Optional, get_args
 from datetime import datetime, timedelta
 from openai import OpenAI
 from dataclasses import dataclass
@@ -51,8 +51,12 @@ class RiskArea(BaseModel):
     affected_establishments: List[int]
 
 class RiskAssessment(BaseModel):
-    risk_areas: List[RiskArea]
+    # Listed first so streamed responses carry it before the risk areas
     overall_risk_level: Literal["low", "medium", "high", "critical"]
+    risk_areas: List[RiskArea]
+
+# Alert severities in ascending order
+SEVERITY_LEVELS = ["low", "medium", "high", "critical"]
 
 class FoodSafetyAlert(BaseModel):
     """Matches the Supabase alerts table schema"""
@@ -73,6 +77,12 @@ class ModelConfig:
     max_tokens: int
     cost_per_1k_tokens: float
 
+@dataclass
+class StreamChunk:
+    content: str = ""
+    total_tokens: int = 0
+    finish_reason: Optional[str] = None
+
 class SupabaseConnector:
     def __init__(self, url: str, key: str):
         self.client: Client = create_client(url, key)
@@ -153,6 +163,82 @@ class SupabaseConnector:
             print(f"Error inserting alerts: {str(e)}")
             raise
 
+class StreamingArrayParser:
+    """Incrementally parse a streamed JSON object, emitting items of one top-level array as they complete
+
+    The object's other top-level fields are collected into `fields` as soon as
+    they can be parsed: those before the array when it opens, the rest when the
+    object closes.
+    """
+    def __init__(self, array_field: str, item_model: type[BaseModel], fields: Optional[Dict[str, Any]] = None):
+        self.array_field = array_field
+        self.item_model = item_model
+        self.fields = fields if fields is not None else {}
+        self.buffer = ""
+        self.pos = 0
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.string_start = None
+        self.last_key = None
+        self.key_start = None
+        self.in_array = False
+        self.found_array = False
+        self.item_start = None
+        self.trailer_start = None
+
+    def feed(self, chunk: str) -> List[BaseModel]:
+        """Consume a chunk of streamed text and return any items completed by it"""
+        self.buffer += chunk
+        items = []
+        while self.pos < len(self.buffer):
+            char = self.buffer[self.pos]
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+                    if self.depth == 1:
+                        self.last_key = self.buffer[self.string_start + 1:self.pos]
+                        self.key_start = self.string_start
+            elif char == '"':
+                self.in_string = True
+                self.string_start = self.pos
+            elif char in "{[":
+                if char == "[" and self.depth == 1 and self.last_key == self.array_field:
+                    self.in_array = True
+                    self.found_array = True
+                    header = self.buffer[:self.key_start].rstrip().rstrip(",")
+                    self.fields.update(json.loads(header + "}"))
+                elif char == "{" and self.in_array and self.depth == 2:
+                    self.item_start = self.pos
+                self.depth += 1
+            elif char in "}]":
+                self.depth -= 1
+                if self.in_array and self.depth == 2 and self.item_start is not None:
+                    item_json = self.buffer[self.item_start:self.pos + 1]
+                    items.append(self.item_model.model_validate(json.loads(item_json)))
+                    self.item_start = None
+                elif self.in_array and self.depth == 1:
+                    self.in_array = False
+                    self.trailer_start = self.pos + 1
+                elif self.depth == 0 and self.trailer_start is not None:
+                    trailer = self.buffer[self.trailer_start:self.pos + 1].lstrip().lstrip(",")
+                    self.fields.update(json.loads("{" + trailer))
+            self.pos += 1
+
+        # Inside the array, drop text that can no longer be part of a pending item
+        if self.in_array and self.item_start is None and not self.in_string:
+            self.buffer = ""
+            self.pos = 0
+        return items
+
+    def is_complete(self) -> bool:
+        """Whether the array and its enclosing object have been fully parsed"""
+        return self.found_array and not self.in_array and self.depth == 0
+
 class AIWorker:
     def __init__(self, model_config: ModelConfig, client: OpenAI):
         self.config = model_config
@@ -167,6 +253,25 @@ class AIWorker:
         """Calculate the total cost based on tokens used"""
         return (self.total_tokens / 1000) * self.config.cost_per_1k_tokens
 
+    def _json_mode_messages(self, data: Any, system_prompt: str, response_format: type[BaseModel]) -> List[Dict[str, str]]:
+        """Build prompts that explicitly mention JSON for the JSON mode fallback"""
+        json_system_prompt = f"""
+        {system_prompt}
+        
+        You must respond with a valid JSON object that exactly matches this schema:
+        {json.dumps(response_format.model_json_schema(), indent=2)}
+        """
+        
+        json_user_prompt = f"""
+        Analyze the following data and respond with a JSON object matching the specified schema:
+        {json.dumps(data) if isinstance(data, (dict, list)) else str(data)}
+        """
+        
+        return [
+            {"role": "system", "content": json_system_prompt},
+            {"role": "user", "content": json_user_prompt}
+        ]
+
     async def process_with_schema(self, data: Any, system_prompt: str, response_format: type[BaseModel]) -> Any:
         """Process data with structured output using Pydantic schema"""
         try:
@@ -189,25 +294,9 @@ class AIWorker:
             except Exception as structured_error:
                 print(f"Structured output failed, falling back to JSON mode: {str(structured_error)}")
                 
-                # Modify prompts to explicitly mention JSON for JSON mode
-                json_system_prompt = f"""
-                {system_prompt}
-                
-                You must respond with a valid JSON object that exactly matches this schema:
-                {json.dumps(response_format.model_json_schema(), indent=2)}
-                """
-                
-                json_user_prompt = f"""
-                Analyze the following data and respond with a JSON object matching the specified schema:
-                {json.dumps(data) if isinstance(data, (dict, list)) else str(data)}
-                """
-                
                 completion = self.client.chat.completions.create(
                     model=self.config.model,
-                    messages=[
-                        {"role": "system", "content": json_system_prompt},
-                        {"role": "user", "content": json_user_prompt}
-                    ],
+                    messages=self._json_mode_messages(data, system_prompt, response_format),
                     response_format={"type": "json_object"},
                     temperature=self.config.temperature,
                     max_tokens=self.config.max_tokens
@@ -222,6 +311,96 @@ class AIWorker:
             print(f"Error in AI processing: {str(e)}")
             raise
 
+    def _stream_content(self, data: Any, system_prompt: str, response_format: type[BaseModel]) -> Iterator[StreamChunk]:
+        """Yield response content deltas, falling back to JSON mode if structured streaming fails"""
+        started = False
+        try:
+            stream_manager = self.client.beta.chat.completions.stream(
+                model=self.config.model,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": json.dumps(data) if isinstance(data, (dict, list)) else str(data)}
+                ],
+                response_format=response_format,
+                temperature=self.config.temperature,
+                max_tokens=self.config.max_tokens,
+                stream_options={"include_usage": True}
+            )
+
+            with stream_manager as stream:
+                for event in stream:
+                    if event.type == "content.delta" and event.delta:
+                        started = True
+                        yield StreamChunk(content=event.delta)
+
+                final_completion = stream.get_final_completion()
+                yield StreamChunk(
+                    total_tokens=final_completion.usage.total_tokens if final_completion.usage else 0,
+                    finish_reason=final_completion.choices[0].finish_reason
+                )
+
+        except Exception as structured_error:
+            # Items may already have been dispatched downstream, so only retry a stream that never started
+            if started:
+                raise
+            print(f"Structured output streaming failed, falling back to JSON mode: {str(structured_error)}")
+
+            completion = self.client.chat.completions.create(
+                model=self.config.model,
+                messages=self._json_mode_messages(data, system_prompt, response_format),
+                response_format={"type": "json_object"},
+                temperature=self.config.temperature,
+                max_tokens=self.config.max_tokens,
+                stream=True,
+                stream_options={"include_usage": True}
+            )
+
+            with completion:
+                for chunk in completion:
+                    yield StreamChunk(
+                        content=(chunk.choices[0].delta.content or "") if chunk.choices else "",
+                        total_tokens=chunk.usage.total_tokens if chunk.usage else 0,
+                        finish_reason=chunk.choices[0].finish_reason if chunk.choices else None
+                    )
+
+    async def stream_with_schema(self, data: Any, system_prompt: str, response_format: type[BaseModel], array_field: str, fields: Optional[Dict[str, Any]] = None) -> AsyncIterator[BaseModel]:
+        """Stream structured output, yielding each item of `array_field` as soon as it is fully parsed
+
+        Other top-level fields of the response are written into `fields` as they are parsed.
+        """
+        item_model = get_args(response_format.model_fields[array_field].annotation)[0]
+        parser = StreamingArrayParser(array_field, item_model, fields)
+        content = self._stream_content(data, system_prompt, response_format)
+        finish_reason = None
+
+        try:
+            # The OpenAI client is blocking, so pull each delta off the event loop
+            # to let downstream stages run while the model is still generating
+            while True:
+                chunk = await asyncio.to_thread(next, content, None)
+                if chunk is None:
+                    break
+                # Usage is tallied here rather than in the worker thread, since
+                # concurrent streams on the same worker share total_tokens
+                self.total_tokens += chunk.total_tokens
+                finish_reason = chunk.finish_reason or finish_reason
+                for item in parser.feed(chunk.content):
+                    yield item
+
+            if finish_reason == "length":
+                raise ValueError(f"Response truncated at max_tokens={self.config.max_tokens}")
+            if not parser.is_complete():
+                raise ValueError(f"Stream ended before the '{array_field}' array was complete")
+
+        except Exception as e:
+            print(f"Error in AI streaming: {str(e)}")
+            raise
+        finally:
+            # A cancelled task may leave its worker thread inside next(); the
+            # generator can't be closed from here then and is left to be collected
+            if not content.gi_running:
+                content.close()
+
 class FoodSafetyPipeline:
     def __init__(self, supabase_url: str, supabase_key: str, openai_client: OpenAI):
         self.supabase = SupabaseConnector(supabase_url, supabase_key)
@@ -278,25 +457,17 @@ class FoodSafetyPipeline:
             PatternAnalysis
         )
 
-    async def assess_risk(self, pattern_analysis: PatternAnalysis) -> RiskAssessment:
-        """Step 2: Assess risks based on pattern analysis"""
-        system_prompt = """
+    def _risk_prompt(self) -> str:
+        return """
         Evaluate food safety risks based on the pattern analysis.
         Consider symptom severity, geographic spread, rate of new cases, and population impact.
         """
-        
-        return await self.risk_assessor.process_with_schema(
-            pattern_analysis.model_dump(),
-            system_prompt,
-            RiskAssessment
-        )
 
-    async def generate_alerts(self, risk_assessment: RiskAssessment) -> List[FoodSafetyAlert]:
-        """Step 3: Generate alerts matching the Supabase schema"""
+    def _alert_prompt(self) -> str:
         # Include valid establishment IDs in the prompt
         valid_ids_str = ", ".join(map(str, self.supabase.valid_establishment_ids))
         
-        system_prompt = f"""
+        return f"""
         Generate food safety alerts based on the risk assessment.
         
         IMPORTANT: You must ONLY use establishment IDs from this list of valid IDs: {valid_ids_str}
@@ -311,14 +482,141 @@ class FoodSafetyPipeline:
         The response must be a JSON object containing an "alerts" array of alert objects.
         All establishment_ids must come from the provided list of valid IDs.
         """
-        
+
+    async def assess_risk(self, pattern_analysis: PatternAnalysis) -> RiskAssessment:
+        """Step 2: Assess risks based on pattern analysis"""
+        return await self.risk_assessor.process_with_schema(
+            pattern_analysis.model_dump(),
+            self._risk_prompt(),
+            RiskAssessment
+        )
+
+    async def generate_alerts(self, risk_assessment: RiskAssessment) -> List[FoodSafetyAlert]:
+        """Step 3: Generate alerts matching the Supabase schema"""
         result = await self.alert_generator.process_with_schema(
             risk_assessment.model_dump(),
-            system_prompt,
+            self._alert_prompt(),
             AlertsResponse
         )
         return result.alerts
 
+    async def stream_risk_areas(self, pattern_analysis: PatternAnalysis) -> AsyncIterator[RiskAssessment]:
+        """Step 2 (streaming): Yield a single-area assessment for each risk area as soon as it is parsed"""
+        fields: Dict[str, Any] = {}
+        pending: List[RiskArea] = []
+        async for risk_area in self.risk_assessor.stream_with_schema(
+            pattern_analysis.model_dump(),
+            self._risk_prompt(),
+            RiskAssessment,
+            "risk_areas",
+            fields
+        ):
+            pending.append(risk_area)
+            # JSON mode may emit overall_risk_level after the areas; hold them until it is known
+            if "overall_risk_level" in fields:
+                for area in pending:
+                    yield RiskAssessment(overall_risk_level=fields["overall_risk_level"], risk_areas=[area])
+                pending = []
+
+        if "overall_risk_level" not in fields:
+            raise ValueError("Risk assessment stream ended without overall_risk_level")
+        for area in pending:
+            yield RiskAssessment(overall_risk_level=fields["overall_risk_level"], risk_areas=[area])
+
+    async def stream_alerts(self, risk_assessment: RiskAssessment) -> AsyncIterator[FoodSafetyAlert]:
+        """Step 3 (streaming): Yield each alert for a single-area assessment as soon as it is parsed"""
+        async for alert in self.alert_generator.stream_with_schema(
+            risk_assessment.model_dump(),
+            self._alert_prompt(),
+            AlertsResponse,
+            "alerts"
+        ):
+            yield alert
+
+    async def run_streaming(self, cases_data: List[Dict], batch_size: int = 5, flush_interval: float = 1.0, max_concurrent_streams: int = 4) -> List[FoodSafetyAlert]:
+        """Run steps 2 and 3 with overlap, writing alerts in batches as they arrive
+
+        No alert waits more than `flush_interval` seconds before it is written.
+        Alerts are generated per risk area, so an establishment named in several
+        areas may get repeated alerts of one type; only those that raise its
+        severity are kept.
+        """
+        patterns = await self.analyze_patterns(cases_data)
+
+        loop = asyncio.get_running_loop()
+        alert_queue: asyncio.Queue = asyncio.Queue()
+        alerts: List[FoodSafetyAlert] = []
+        area_tasks: List[asyncio.Task] = []
+        # Bounds open OpenAI connections; the default of 4 alert streams plus the
+        # risk stream also fits the smallest default to_thread executor
+        stream_slots = asyncio.Semaphore(max_concurrent_streams)
+
+        async def generate_for_area(risk_assessment: RiskAssessment) -> None:
+            async with stream_slots:
+                async for alert in self.stream_alerts(risk_assessment):
+                    await alert_queue.put(alert)
+
+        async def dispatch_areas() -> None:
+            # Each risk area starts alert generation while later areas are still streaming
+            async for risk_assessment in self.stream_risk_areas(patterns):
+                area_tasks.append(asyncio.create_task(generate_for_area(risk_assessment)))
+            await asyncio.gather(*area_tasks)
+
+        async def write_batches() -> None:
+            batch: List[FoodSafetyAlert] = []
+            deadline = 0.0
+            seen_severity: Dict[tuple, int] = {}
+            while True:
+                try:
+                    # Flush a partial batch once its oldest alert has waited flush_interval
+                    timeout = max(0.0, deadline - loop.time()) if batch else None
+                    alert = await asyncio.wait_for(alert_queue.get(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    await self.supabase.insert_alerts(batch)
+                    batch = []
+                    continue
+                if alert is None:
+                    break
+
+                key = (alert.establishment_id, alert.alert_type)
+                severity = SEVERITY_LEVELS.index(alert.severity)
+                if key in seen_severity:
+                    if severity <= seen_severity[key]:
+                        print(f"Skipping duplicate {alert.alert_type} alert for establishment {alert.establishment_id}")
+                        continue
+                    print(f"Escalating {alert.alert_type} alert for establishment {alert.establishment_id} "
+                          f"from {SEVERITY_LEVELS[seen_severity[key]]} to {alert.severity}")
+                seen_severity[key] = severity
+
+                alerts.append(alert)
+                if not batch:
+                    deadline = loop.time() + flush_interval
+                batch.append(alert)
+                if len(batch) >= batch_size:
+                    await self.supabase.insert_alerts(batch)
+                    batch = []
+            if batch:
+                await self.supabase.insert_alerts(batch)
+
+        writer = asyncio.create_task(write_batches())
+        dispatcher = asyncio.create_task(dispatch_areas())
+        try:
+            # The writer only finishes early by failing; either way, stop streaming at once
+            done, _ = await asyncio.wait({writer, dispatcher}, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()
+        finally:
+            # Stop every producer before the writer drains the queue
+            dispatcher.cancel()
+            for task in area_tasks:
+                task.cancel()
+            await asyncio.gather(dispatcher, *area_tasks, return_exceptions=True)
+            if not writer.done():
+                await alert_queue.put(None)
+                await writer
+
+        return alerts
+
     def get_cost_report(self) -> Dict[str, float]:
         """Generate detailed cost report"""
         return {
@@ -355,17 +653,8 @@ async def main():
                 "costs": pipeline.get_cost_report()
             }
         
-        print("Analyzing patterns...")
-        patterns = await pipeline.analyze_patterns(cases_data)
-        
-        print("Assessing risks...")
-        risks = await pipeline.assess_risk(patterns)
-        
-        print("Generating alerts...")
-        alerts = await pipeline.generate_alerts(risks)
-        
-        print("Inserting alerts...")
-        await pipeline.supabase.insert_alerts(alerts)
+        print("Analyzing patterns, then streaming risks and alerts...")
+        alerts = await pipeline.run_streaming(cases_data)
         
         costs = pipeline.get_cost_report()
         